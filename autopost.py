@@ -3,20 +3,59 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
+import heapq
 import json
 import logging
 import os
+import platform
+import re
 import sys
+import threading
 import time
+from collections.abc import Collection, Generator, Iterable, Iterator
 from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
 
 import tweepy
 
-DEFAULT_STATE_PATH = Path(".autopost_state.json")
+try:
+    import orjson
+except ImportError:  # optional: the stdlib fallback writes identical files, just slower
+    orjson = None  # type: ignore[assignment]
+
+DEFAULT_STATE_PATH = Path(".autopost_state.jsonl")
 DEFAULT_INTERVAL_SECONDS = 24 * 60 * 60
+DEFAULT_BATCH_SIZE = 1
+# Fewer APPEND round trips than tweepy's 1 MiB default; the endpoint caps at 5 MiB.
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
 VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".avi", ".mkv", ".webm"}
+VIDEO_SUFFIXES = tuple(sorted(VIDEO_EXTENSIONS))
+# Posted ids are "<size>:<sha256 of the first FINGERPRINT_BYTES>"; stable across renames.
+FINGERPRINT_BYTES = 64 * 1024
+FILE_ID_RE = re.compile(r"\d+:[0-9a-f]{64}")
+# Mtimes this recent may miss a change made in the same timestamp tick.
+RACY_MTIME_WINDOW_NS = 2_000_000_000
+
+IDLE_CACHE_PATH = Path(os.environ.get("XDG_CACHE_HOME") or "~/.cache").expanduser() / "autopost" / "listing.json"
+
+# Folder -> [folder mtime, state file mtime] when last scanned with nothing to post.
+_idle_folders: dict[str, list[int | None]] | None = None
+
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+if orjson is not None:
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    json_loads = json.loads
 
 
 @dataclass
@@ -29,6 +68,13 @@ class Config:
     caption: str
     state_file: Path
     interval_seconds: int
+    batch_size: int
+
+
+@dataclass
+class TwitterClients:
+    api_v1: tweepy.API
+    client_v2: tweepy.Client
 
 
 def load_config(args: argparse.Namespace) -> Config:
@@ -41,8 +87,16 @@ def load_config(args: argparse.Namespace) -> Config:
         return value
 
     interval = args.interval if args.interval is not None else int(env.get("POST_INTERVAL_SECONDS", DEFAULT_INTERVAL_SECONDS))
+    if interval < 1:
+        raise ValueError(f"Interval must be at least 1 second, got {interval}")
     state_file = Path(args.state_file or env.get("STATE_FILE", DEFAULT_STATE_PATH))
+    if state_file.suffix == ".json":
+        # Legacy JSON state is migrated to the line log on first load.
+        state_file = state_file.with_suffix(".jsonl")
     caption = args.caption if args.caption is not None else env.get("POST_CAPTION", "")
+    batch_size = args.batch_size if args.batch_size is not None else int(env.get("POST_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    if batch_size < 1:
+        raise ValueError(f"Batch size must be at least 1, got {batch_size}")
 
     return Config(
         videos_folder=Path(require("LOCAL_VIDEO_FOLDER")).expanduser().resolve(),
@@ -53,10 +107,11 @@ def load_config(args: argparse.Namespace) -> Config:
         caption=caption,
         state_file=state_file,
         interval_seconds=interval,
+        batch_size=batch_size,
     )
 
 
-def build_twitter_clients(config: Config):
+def build_twitter_clients(config: Config) -> TwitterClients:
     auth = tweepy.OAuth1UserHandler(
         config.twitter_consumer_key,
         config.twitter_consumer_secret,
@@ -72,69 +127,281 @@ def build_twitter_clients(config: Config):
         access_token_secret=config.twitter_access_token_secret,
         wait_on_rate_limit=True,
     )
-    return api_v1, client_v2
+    return TwitterClients(api_v1=api_v1, client_v2=client_v2)
 
 
-def load_state(path: Path) -> dict[str, Any]:
+def load_state(path: Path, candidates: Collection[str] | None = None) -> set[str]:
+    # Only ids in candidates are kept, so memory tracks the folder, not the history.
+    if candidates is not None and not candidates:
+        return set()
+    migrate_legacy_state(path)
     if not path.exists():
-        return {"posted_files": []}
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+        return set()
+
+    posted = set()
+    entries = _iter_state(path)
+    for entry in entries:
+        if not FILE_ID_RE.fullmatch(entry):
+            entries.close()
+            posted = migrate_path_entries(path, set(_iter_state(path)))
+            if candidates is not None:
+                posted.intersection_update(candidates)
+            break
+        if candidates is None or entry in candidates:
+            posted.add(entry)
+    return posted
+
+
+def _iter_state(path: Path) -> Generator[str, None, None]:
+    complete = 0
+    with path.open("rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            complete += len(line)
+            if line.strip():
+                yield json_loads(line)
+        else:
+            return
+
+    # Drop a torn append so the next one starts on a fresh line.
+    logging.warning("Discarding incomplete trailing entry in state file: %s", path)
+    os.truncate(path, complete)
+
+
+def open_state_log(path: Path) -> BinaryIO:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.open("ab")
+
 
+def append_state(log: BinaryIO, file_id: str) -> None:
+    log.write(json_dumps(file_id) + b"\n")
+    log.flush()
+    _datasync(log.fileno())
 
-def save_state(path: Path, state: dict[str, Any]) -> None:
+
+def write_state(path: Path, entries: Iterable[str]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.writelines(json_dumps(entry) + b"\n" for entry in entries)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def migrate_legacy_state(path: Path) -> None:
+    legacy = path.with_suffix(".json")
+    if path.exists():
+        if not is_legacy_state(path):
+            return
+        legacy = path
+    elif legacy == path or not legacy.exists():
+        return
+
+    posted_files = json_loads(legacy.read_bytes()).get("posted_files", [])
+
+    write_state(path, posted_files)
+    logging.info("Migrated %d posted entries from %s to %s", len(posted_files), legacy, path)
+
+
+def is_legacy_state(path: Path) -> bool:
+    # The old format is one JSON object; log lines always start with a string.
+    with path.open("rb") as f:
+        return f.read(64).lstrip().startswith(b"{")
+
+
+def migrate_path_entries(path: Path, entries: set[str]) -> set[str]:
+    # Older state recorded paths; ones that no longer exist are dropped.
+    posted = set()
+    for entry in entries:
+        if FILE_ID_RE.fullmatch(entry):
+            posted.add(entry)
+            continue
+        try:
+            posted.add(file_id(entry))
+        except OSError:
+            pass
+
+    write_state(path, posted)
+    logging.info("Converted posted paths in %s to file ids (%d kept of %d).", path, len(posted), len(entries))
+    return posted
 
 
-def list_local_videos(folder: Path) -> list[Path]:
+def file_id(path: str | Path) -> str:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest = hashlib.sha256(f.read(FINGERPRINT_BYTES)).hexdigest()
+    return f"{size}:{digest}"
+
+
+def list_local_videos(folder: Path) -> list[tuple[float, str, Path]]:
     if not folder.exists() or not folder.is_dir():
         raise ValueError(f"LOCAL_VIDEO_FOLDER does not exist or is not a directory: {folder}")
 
-    videos = [
-        path for path in folder.iterdir()
-        if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS
-    ]
-    return sorted(videos, key=lambda p: p.stat().st_mtime)
+    entries = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.name.lower().endswith(VIDEO_SUFFIXES) and entry.is_file():
+                try:
+                    st = entry.stat()
+                    entries.append((st.st_mtime, cached_file_id(entry.path, st), Path(entry.path)))
+                except OSError:
+                    continue
+    # A heap, not a sort: callers usually stop at the first unposted video.
+    heapq.heapify(entries)
+    return entries
+
+
+def cached_file_id(path: str, st: os.stat_result) -> str:
+    if time.time_ns() - st.st_mtime_ns < RACY_MTIME_WINDOW_NS:
+        return file_id(path)
+    return _file_id_for(path, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_id_for(path: str, ino: int, size: int, mtime_ns: int) -> str:
+    return file_id(path)
+
+
+def iter_oldest(heap: list[tuple[float, str, Path]]) -> Iterator[tuple[str, Path]]:
+    while heap:
+        _, video_id, video = heapq.heappop(heap)
+        yield video_id, video
 
 
 def post_video(api_v1, client_v2, file_path: Path, caption: str) -> str:
-    media = api_v1.media_upload(filename=str(file_path), media_category="tweet_video", chunked=True)
+    with file_path.open("rb") as fh:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        media = api_v1.media_upload(
+            filename=str(file_path),
+            file=fh,
+            media_category="tweet_video",
+            chunked=True,
+            chunk_size=UPLOAD_CHUNK_SIZE,
+        )
     response = client_v2.create_tweet(text=caption, media_ids=[media.media_id])
     return str(response.data["id"])
 
 
-def pick_unposted(videos: list[Path], posted_files: set[str]) -> Path | None:
-    for video in videos:
-        if str(video) not in posted_files:
-            return video
-    return None
+def mtime_ns(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def listing_signature(config: Config) -> tuple[int, int | None] | None:
+    folder_mtime = mtime_ns(config.videos_folder)
+    if folder_mtime is None:
+        return None
+    return folder_mtime, mtime_ns(config.state_file)
+
+
+def _idle_cache() -> dict[str, list[int | None]]:
+    global _idle_folders
+    if _idle_folders is None:
+        try:
+            cache = json_loads(IDLE_CACHE_PATH.read_bytes())
+        except (OSError, ValueError):
+            cache = None
+        _idle_folders = cache if isinstance(cache, dict) else {}
+    return _idle_folders
+
+
+def is_idle_folder(folder: Path, signature: tuple[int, int | None] | None) -> bool:
+    if signature is None:
+        return False
+    return _idle_cache().get(str(folder)) == list(signature)
+
+
+def remember_idle_folder(folder: Path, signature: tuple[int, int | None] | None) -> None:
+    if signature is None or time.time_ns() - signature[0] < RACY_MTIME_WINDOW_NS:
+        return
+
+    cache = _idle_cache()
+    cache[str(folder)] = list(signature)
+    try:
+        IDLE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = IDLE_CACHE_PATH.with_name(IDLE_CACHE_PATH.name + ".tmp")
+        tmp.write_bytes(json_dumps(cache))
+        os.replace(tmp, IDLE_CACHE_PATH)
+    except OSError as exc:
+        logging.debug("Could not write listing cache %s: %s", IDLE_CACHE_PATH, exc)
+
+
+def iter_unposted(videos: Iterable[tuple[str, Path]], posted_ids: set[str]) -> Iterator[tuple[str, Path]]:
+    queued: set[str] = set()
+    for video_id, video in videos:
+        # Hard links and identical copies share an id.
+        if video_id not in posted_ids and video_id not in queued:
+            queued.add(video_id)
+            yield video_id, video
 
 
-def run_once(config: Config) -> bool:
+def run_once(config: Config, clients: TwitterClients) -> bool:
     logging.info("Checking local folder for new videos: %s", config.videos_folder)
-    api_v1, client_v2 = build_twitter_clients(config)
 
-    state = load_state(config.state_file)
-    posted_files = set(state.get("posted_files", []))
+    # An idle folder stays idle until its mtime or the state file's changes.
+    signature = listing_signature(config)
+    if is_idle_folder(config.videos_folder, signature):
+        logging.info("Folder unchanged since last check; no unposted videos.")
+        return False
 
     videos = list_local_videos(config.videos_folder)
-    video = pick_unposted(videos, posted_files)
+    posted_ids = load_state(config.state_file, {video_id for _, video_id, _ in videos})
+    batch = list(islice(iter_unposted(iter_oldest(videos), posted_ids), config.batch_size))
 
-    if not video:
+    if not batch:
         logging.info("No unposted videos found.")
+        remember_idle_folder(config.videos_folder, signature)
         return False
 
-    logging.info("Uploading and posting '%s' to X...", video.name)
-    tweet_id = post_video(api_v1, client_v2, video, config.caption)
+    posted = 0
+    with open_state_log(config.state_file) as log:
+        for video_id, video in batch:
+            logging.info("Uploading and posting '%s' to X...", video.name)
+            try:
+                tweet_id = post_video(clients.api_v1, clients.client_v2, video, config.caption)
+            except tweepy.errors.TooManyRequests:
+                logging.warning("Rate limited by X; stopping this cycle after %d post(s).", posted)
+                break
+
+            append_state(log, video_id)
+            posted += 1
+            logging.info("Posted successfully. Tweet ID: %s", tweet_id)
+
+    return posted > 0
+
 
-    posted_files.add(str(video))
-    state["posted_files"] = sorted(posted_files)
-    save_state(config.state_file, state)
+def watch_folder(folder: Path, wake: threading.Event) -> Any | None:
+    if platform.system() != "Linux":
+        return None
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        logging.info("watchdog is not installed; polling the folder every interval instead.")
+        return None
+
+    def is_video(path: str) -> bool:
+        return path.lower().endswith(VIDEO_SUFFIXES)
+
+    # on_created is ignored: it fires before a copy has finished writing.
+    class NewVideoHandler(FileSystemEventHandler):
+        def on_closed(self, event) -> None:
+            if not event.is_directory and is_video(event.src_path):
+                wake.set()
 
-    logging.info("Posted successfully. Tweet ID: %s", tweet_id)
-    return True
+        def on_moved(self, event) -> None:
+            if not event.is_directory and is_video(event.dest_path):
+                wake.set()
+
+    observer = Observer()
+    observer.schedule(NewVideoHandler(), str(folder), recursive=False)
+    observer.start()
+    return observer
 
 
 def parse_args() -> argparse.Namespace:
@@ -142,7 +409,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--run-once", action="store_true", help="Run one cycle and exit.")
     parser.add_argument("--interval", type=int, default=None, help="Seconds between runs (default 86400).")
     parser.add_argument("--caption", default=None, help="Custom caption text to use for every post.")
-    parser.add_argument("--state-file", default=None, help="Path to JSON state file.")
+    parser.add_argument("--batch-size", type=int, default=None, help="Maximum videos to post per run (default 1).")
+    parser.add_argument("--state-file", default=None, help="Path to the posted-files log (JSON lines).")
     parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
     return parser.parse_args()
 
@@ -157,17 +425,36 @@ def main() -> int:
         logging.error("Configuration error: %s", exc)
         return 1
 
+    # Built once so every cycle reuses the same HTTP sessions.
+    clients = build_twitter_clients(config)
+
     if args.run_once:
-        run_once(config)
+        run_once(config, clients)
         return 0
 
     logging.info("Starting autopost loop. Interval: %s seconds", config.interval_seconds)
+    wake = threading.Event()
+    observer = watch_folder(config.videos_folder, wake)
+    next_run = time.monotonic()
     while True:
+        wake.clear()
+        idle = False
         try:
-            run_once(config)
+            idle = not run_once(config, clients)
         except Exception:
             logging.exception("Autopost cycle failed")
-        time.sleep(config.interval_seconds)
+
+        # Fixed slots; overrun ones coalesce, and watch-triggered runs don't move them.
+        now = time.monotonic()
+        if next_run <= now:
+            missed = int((now - next_run) // config.interval_seconds)
+            next_run += (missed + 1) * config.interval_seconds
+
+        timeout = max(0.0, next_run - time.monotonic())
+        if observer is not None and idle:
+            wake.wait(timeout)
+        else:
+            time.sleep(timeout)
 
 
 if __name__ == "__main__":